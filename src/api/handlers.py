@@ -5,11 +5,27 @@ Request handlers for the configuration API
 from twisted.internet import defer
 from twisted.python import log
 from typing import Dict, Any, Optional, List
+from psycopg.errors import UniqueViolation
 import json
+import os
 
 from database.connection import DatabaseManager
 from models.configuration import ConfigurationValidator, ConfigurationProcessor
 
+# Include exception text in 500 responses; off by default so error paths
+# don't format messages that only matter while debugging
+DEBUG = os.getenv('DEBUG') == '1'
+
+# Query parameter keys as Twisted exposes them in request.args
+_VERSION_KEY = b'version'
+_VERSIONS_KEY = b'versions'
+_TEMPLATE_KEY = b'template'
+_PRETTY_KEY = b'pretty'
+_RESERVED_KEYS = frozenset({_VERSION_KEY, _VERSIONS_KEY, _TEMPLATE_KEY, _PRETTY_KEY})
+
+# Bodies larger than this are parsed straight from request.content
+_STREAM_THRESHOLD = 64 * 1024
+
 class ConfigurationHandler:
     """Handles configuration-related HTTP requests"""
     
@@ -22,23 +38,26 @@ class ConfigurationHandler:
     def handle_post_config(self, request, service_name: str) -> Dict[str, Any]:
         """Handle POST request to save configuration"""
         try:
-            # Read request body
-            content = request.content.read()
+            # Read request body; small bodies are read whole, larger ones
+            # (which Twisted spools to a temporary file) are streamed
+            content = request.content.read(_STREAM_THRESHOLD)
             if not content:
                 defer.returnValue({
                     "error": "Empty request body",
                     "status_code": 400
                 })
+            if len(content) == _STREAM_THRESHOLD:
+                request.content.seek(0)
+                content = request.content
             
-            yaml_content = content.decode('utf-8')
-            
-            # Validate YAML format
+            # Validate YAML format; the loader decodes UTF-8 bytes itself
             try:
-                config_data = self.validator.validate_yaml(yaml_content)
+                config_data = self.validator.validate_yaml(content)
             except ValueError as e:
+                message = f"{e}: {e.__cause__}" if e.__cause__ is not None else str(e)
                 defer.returnValue({
                     "error": "Bad Request",
-                    "message": str(e),
+                    "message": message,
                     "status_code": 400
                 })
             
@@ -60,21 +79,21 @@ class ConfigurationHandler:
                     service_name, config_data, version
                 )
                 defer.returnValue(result)
+            except UniqueViolation:
+                defer.returnValue({
+                    "error": "Version already exists",
+                    "message": f"Version {version} already exists for service {service_name}",
+                    "status_code": 409
+                })
             except Exception as e:
                 log.err(f"Database error: {e}")
-                if "duplicate key value" in str(e).lower():
-                    defer.returnValue({
-                        "error": "Version already exists",
-                        "message": f"Version {version} already exists for service {service_name}",
-                        "status_code": 409
-                    })
                 raise
         
         except Exception as e:
             log.err(f"Error handling POST config: {e}")
             defer.returnValue({
                 "error": "Internal server error",
-                "message": str(e),
+                "message": str(e) if DEBUG else type(e).__name__,
                 "status_code": 500
             })
     
@@ -83,8 +102,20 @@ class ConfigurationHandler:
         """Handle GET request to retrieve configuration"""
         try:
             # Parse query parameters
-            version = self._get_query_param(request, 'version')
-            template_flag = self._get_query_param(request, 'template')
+            version = self._get_query_param(request, _VERSION_KEY)
+            versions = self._get_query_param(request, _VERSIONS_KEY)
+            template_flag = self._get_query_param(request, _TEMPLATE_KEY)
+            
+            # Several versions in one round-trip
+            if versions is not None:
+                if version is not None:
+                    defer.returnValue({
+                        "error": "Invalid version parameter",
+                        "message": "Use either version or versions, not both",
+                        "status_code": 400
+                    })
+                result = yield self._handle_get_versions(request, service_name, versions, template_flag)
+                defer.returnValue(result)
             
             # Convert version to int if provided
             if version:
@@ -114,19 +145,8 @@ class ConfigurationHandler:
             
             # Process template if requested
             if template_flag == '1':
-                # Extract template variables from query parameters
-                template_vars = {}
-                
-                # Get template variables from query params
-                for key, values in request.args.items():
-                    key_str = key.decode('utf-8')
-                    if key_str not in ['version', 'template']:  # Skip special params
-                        template_vars[key_str] = values[0].decode('utf-8')
-                
-                # Add default template variables
-                template_vars.setdefault('user', 'Anonymous')
-                
                 try:
+                    template_vars = self._get_template_vars(request)
                     config = self.processor.process_template(config, template_vars)
                 except ValueError as e:
                     defer.returnValue({
@@ -141,10 +161,49 @@ class ConfigurationHandler:
             log.err(f"Error handling GET config: {e}")
             defer.returnValue({
                 "error": "Internal server error",
-                "message": str(e),
+                "message": str(e) if DEBUG else type(e).__name__,
                 "status_code": 500
             })
     
+    @defer.inlineCallbacks
+    def _handle_get_versions(self, request, service_name: str, versions_param: str,
+                             template_flag: Optional[str]) -> Dict[str, Any]:
+        """Handle GET request for several configuration versions at once"""
+        try:
+            versions = list(dict.fromkeys(int(v) for v in versions_param.split(',')))
+        except ValueError:
+            defer.returnValue({
+                "error": "Invalid versions parameter",
+                "message": "Versions must be a comma-separated list of integers",
+                "status_code": 400
+            })
+        
+        configs = yield self.db_manager.get_configurations(service_name, versions)
+        
+        if not configs:
+            defer.returnValue({
+                "error": "Not Found",
+                "message": f"Configuration versions {versions_param} not found for service {service_name}",
+                "status_code": 404
+            })
+        
+        if template_flag == '1':
+            try:
+                template_vars = self._get_template_vars(request)
+                configs = {
+                    v: self.processor.process_template(config, template_vars)
+                    for v, config in configs.items()
+                }
+            except ValueError as e:
+                defer.returnValue({
+                    "error": "Template processing error",
+                    "message": str(e),
+                    "status_code": 400
+                })
+        
+        # JSON object keys must be strings
+        defer.returnValue({str(v): config for v, config in configs.items()})
+    
     @defer.inlineCallbacks
     def handle_get_history(self, request, service_name: str) -> List[Dict[str, Any]]:
         """Handle GET request to retrieve configuration history"""
@@ -165,13 +224,26 @@ class ConfigurationHandler:
             log.err(f"Error handling GET history: {e}")
             defer.returnValue({
                 "error": "Internal server error",
-                "message": str(e),
+                "message": str(e) if DEBUG else type(e).__name__,
                 "status_code": 500
             })
     
-    def _get_query_param(self, request, param_name: str) -> Optional[str]:
+    def _get_template_vars(self, request) -> Dict[str, str]:
+        """Extract template variables from non-reserved query parameters"""
+        # Raises UnicodeDecodeError (a ValueError) on invalid UTF-8
+        template_vars = {}
+        for key, values in request.args.items():
+            if key in _RESERVED_KEYS:  # Skip special params
+                continue
+            template_vars[key.decode('utf-8')] = values[0].decode('utf-8')
+        
+        # Add default template variables
+        template_vars.setdefault('user', 'Anonymous')
+        return template_vars
+    
+    def _get_query_param(self, request, param_key: bytes) -> Optional[str]:
         """Extract query parameter from request"""
-        args = request.args
-        if param_name.encode() in args:
-            return args[param_name.encode()][0].decode('utf-8')
+        values = request.args.get(param_key)
+        if values:
+            return values[0].decode('utf-8')
         return None
\ No newline at end of file
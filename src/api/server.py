@@ -5,12 +5,44 @@ REST API server for configuration management
 from twisted.web import resource, server
 from twisted.internet import defer
 from twisted.python import log
+import orjson
 import json
 from typing import Dict, Any, Optional
+from collections import OrderedDict
 
 from database.connection import DatabaseManager
 from models.configuration import ConfigurationValidator, ConfigurationProcessor
-from .handlers import ConfigurationHandler
+from .handlers import ConfigurationHandler, DEBUG, _PRETTY_KEY
+
+# Static parts of the 500 response body; only the message is serialized per error
+_ERR_PREFIX = b'{"error":"Internal server error","message":'
+_ERR_SUFFIX = b'}'
+
+def _finish(request, body: bytes) -> None:
+    """Write the complete response body and finish the request"""
+    # A known length lets Twisted send the body as-is instead of chunk-framing it
+    request.setHeader(b'content-length', b'%d' % len(body))
+    request.write(body)
+    request.finish()
+
+def _write_json(request, result: Any) -> None:
+    """Serialize result as the response body, indented only for ?pretty=1"""
+    pretty = request.args.get(_PRETTY_KEY, [None])[0] == b'1'
+    try:
+        body = orjson.dumps(result, option=orjson.OPT_INDENT_2 if pretty else 0)
+    except TypeError:
+        # Integers above 64 bits, which orjson can't encode
+        body = json.dumps(result, ensure_ascii=False, indent=2 if pretty else None,
+                          separators=None if pretty else (',', ':')).encode()
+    _finish(request, body)
+
+def _write_failure(failure, request) -> None:
+    """Log an unhandled failure and respond with 500 Internal Server Error"""
+    log.err(failure)
+    request.setResponseCode(500)
+    request.setHeader(b'content-type', b'application/json')
+    message = str(failure.value) if DEBUG else type(failure.value).__name__
+    _finish(request, _ERR_PREFIX + orjson.dumps(message) + _ERR_SUFFIX)
 
 class ConfigurationService:
     """Main configuration service class"""
@@ -32,15 +64,28 @@ class ConfigurationService:
 class ConfigResource(resource.Resource):
     """Main config resource that handles routing"""
     
+    # Service resources are reused across requests, least recently used first out
+    MAX_CACHED_SERVICES = 1024
+    
     def __init__(self, db_manager: DatabaseManager):
         resource.Resource.__init__(self)
         self.db_manager = db_manager
         self.handler = ConfigurationHandler(db_manager)
+        self._services: "OrderedDict[bytes, ServiceResource]" = OrderedDict()
     
     def getChild(self, path: bytes, request) -> resource.Resource:
         """Route requests to service-specific resources"""
+        service = self._services.get(path)
+        if service is not None:
+            self._services.move_to_end(path)
+            return service
+        
         service_name = path.decode('utf-8')
-        return ServiceResource(self.db_manager, service_name, self.handler)
+        service = ServiceResource(self.db_manager, service_name, self.handler)
+        self._services[path] = service
+        if len(self._services) > self.MAX_CACHED_SERVICES:
+            self._services.popitem(last=False)
+        return service
 
 class ServiceResource(resource.Resource):
     """Resource for service-specific operations"""
@@ -62,23 +107,11 @@ class ServiceResource(resource.Resource):
                 request.setResponseCode(result.get('status_code', 500))
             else:
                 request.setResponseCode(201)
-            request.write(json.dumps(result, indent=2).encode('utf-8'))
-            request.finish()
-        
-        def handle_error(failure):
-            log.err(failure)
-            request.setResponseCode(500)
-            request.setHeader(b'content-type', b'application/json')
-            error_response = {
-                "error": "Internal server error",
-                "message": str(failure.value)
-            }
-            request.write(json.dumps(error_response, indent=2).encode('utf-8'))
-            request.finish()
+            _write_json(request, result)
         
         d = self.handler.handle_post_config(request, self.service_name)
         d.addCallback(handle_response)
-        d.addErrback(handle_error)
+        d.addErrback(_write_failure, request)
         
         return server.NOT_DONE_YET
     
@@ -90,23 +123,11 @@ class ServiceResource(resource.Resource):
                 request.setResponseCode(result.get('status_code', 404))
             else:
                 request.setResponseCode(200)
-            request.write(json.dumps(result, indent=2).encode('utf-8'))
-            request.finish()
-        
-        def handle_error(failure):
-            log.err(failure)
-            request.setResponseCode(500)
-            request.setHeader(b'content-type', b'application/json')
-            error_response = {
-                "error": "Internal server error",
-                "message": str(failure.value)
-            }
-            request.write(json.dumps(error_response, indent=2).encode('utf-8'))
-            request.finish()
+            _write_json(request, result)
         
         d = self.handler.handle_get_config(request, self.service_name)
         d.addCallback(handle_response)
-        d.addErrback(handle_error)
+        d.addErrback(_write_failure, request)
         
         return server.NOT_DONE_YET
 
@@ -127,22 +148,10 @@ class HistoryResource(resource.Resource):
                 request.setResponseCode(result.get('status_code', 404))
             else:
                 request.setResponseCode(200)
-            request.write(json.dumps(result, indent=2).encode('utf-8'))
-            request.finish()
-        
-        def handle_error(failure):
-            log.err(failure)
-            request.setResponseCode(500)
-            request.setHeader(b'content-type', b'application/json')
-            error_response = {
-                "error": "Internal server error",
-                "message": str(failure.value)
-            }
-            request.write(json.dumps(error_response, indent=2).encode('utf-8'))
-            request.finish()
+            _write_json(request, result)
         
         d = self.handler.handle_get_history(request, self.service_name)
         d.addCallback(handle_response)
-        d.addErrback(handle_error)
+        d.addErrback(_write_failure, request)
         
         return server.NOT_DONE_YET
\ No newline at end of file
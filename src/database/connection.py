@@ -2,173 +2,274 @@
 Database connection and management
 """
 
-import aiopg
-from twisted.internet import defer, threads, reactor
+import orjson
+from psycopg import AsyncConnection
+from psycopg.types.json import Jsonb, set_json_dumps, set_json_loads
+from psycopg_pool import AsyncConnectionPool
+from twisted.internet import defer
 from twisted.python import log
-from typing import Dict, List, Optional, Any
-import json
-from datetime import datetime
+from typing import Dict, List, Optional, Any, Coroutine, Tuple
+from collections import OrderedDict
 import asyncio
+import json
+import re
+
+# 19+ digit runs may be integers outside orjson's 64-bit range
+_LONG_NUMBER = re.compile(rb'\d{19}')
+
+def _dump_json(obj: Any) -> bytes:
+    """Serialize a payload with orjson, falling back to json for big integers"""
+    try:
+        # YAML mappings may have non-string keys; store them as JSON strings
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    except TypeError:
+        # YAML integers are unbounded; orjson refuses those above 64 bits
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode()
+
+def _load_json(data: bytes) -> Any:
+    """Parse a jsonb payload with orjson unless it may hold integers above 64 bits"""
+    # orjson would read such integers as floats; json keeps them exact
+    if _LONG_NUMBER.search(data):
+        return json.loads(data)
+    return orjson.loads(data)
 
 class DatabaseManager:
-    """Manages PostgreSQL database connections and operations"""
+    """Manages PostgreSQL database connections and operations
     
-    def __init__(self, database_url: str):
+    Requires the asyncio reactor: the psycopg pool runs on the reactor's own
+    event loop, so queries complete as native Deferreds without a thread hop.
+    Statements are server-side prepared and results use the binary protocol.
+    
+    Payloads returned by get_configuration are cached in-process (LRU
+    keyed by service and version) and shared between callers, who must
+    treat them as read-only. Pass cache_latest=False when other processes
+    write to the same database, since only explicit versions are immutable.
+    """
+    
+    def __init__(self, database_url: str, cache_size: int = 1024, cache_latest: bool = True):
         self.database_url = database_url
         self.pool = None
         self._loop = None
+        
+        self._cache: "OrderedDict[Tuple[str, Optional[int]], Dict[str, Any]]" = OrderedDict()
+        self._cache_size = cache_size
+        self._cache_latest = cache_latest
+        # Bumped on every save so in-flight reads can't repopulate stale entries
+        self._generation: Dict[str, int] = {}
     
     @defer.inlineCallbacks
     def initialize(self):
         """Initialize database connection pool"""
         try:
-            # Create event loop in a thread
-            self._loop = yield threads.deferToThread(self._create_loop)
-            self.pool = yield threads.deferToThread(self._create_pool)
+            self._loop = asyncio.get_event_loop()
+            self.pool = yield self._run(self._create_pool())
             log.msg("Database pool created successfully")
         except Exception as e:
             log.err(f"Failed to initialize database: {e}")
             raise
     
-    def _create_loop(self):
-        """Create and return a new event loop"""
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        return loop
+    def _run(self, coro: Coroutine) -> defer.Deferred:
+        """Schedule a coroutine on the reactor's event loop as a Deferred"""
+        return defer.Deferred.fromFuture(self._loop.create_task(coro))
     
-    def _create_pool(self):
-        """Create aiopg connection pool using the existing loop"""
-        async def create():
-            return await aiopg.create_pool(self.database_url)
-        
-        return self._loop.run_until_complete(create())
+    async def _create_pool(self) -> AsyncConnectionPool:
+        """Create and open psycopg connection pool"""
+        pool = AsyncConnectionPool(
+            self.database_url, open=False, configure=self._configure_connection
+        )
+        await pool.open(wait=True)
+        return pool
+    
+    @staticmethod
+    async def _configure_connection(conn: AsyncConnection):
+        """Adapt jsonb payloads with orjson on each pooled connection"""
+        set_json_dumps(_dump_json, conn)
+        set_json_loads(_load_json, conn)
     
     @defer.inlineCallbacks
     def save_configuration(self, service: str, payload: Dict[str, Any], version: Optional[int] = None) -> Dict[str, Any]:
         """Save configuration to database"""
         try:
-            result = yield threads.deferToThread(
-                self._save_config_sync, service, payload, version
-            )
+            result = yield self._run(self._save_config(service, payload, version))
+            self._invalidate(service)
             defer.returnValue(result)
         except Exception as e:
             log.err(f"Failed to save configuration: {e}")
             raise
     
-    def _save_config_sync(self, service: str, payload: Dict[str, Any], version: Optional[int] = None) -> Dict[str, Any]:
-        """Synchronous save configuration using the existing loop"""
-        async def save():
-            async with self.pool.acquire() as conn:
-                async with conn.cursor() as cur:
-                    # Get next version if not specified
-                    if version is None:
-                        await cur.execute(
-                            "SELECT COALESCE(MAX(version), 0) + 1 FROM configurations WHERE service = %s",
-                            (service,)
-                        )
-                        current_version = (await cur.fetchone())[0]
-                    else:
-                        current_version = version
-                    
+    async def _save_config(self, service: str, payload: Dict[str, Any], version: Optional[int] = None) -> Dict[str, Any]:
+        """Save configuration query"""
+        async with self.pool.connection() as conn:
+            async with conn.cursor(binary=True) as cur:
+                if version is None:
+                    # Assign the next version in the same round-trip as the insert
+                    await cur.execute(
+                        """
+                        INSERT INTO configurations (service, version, payload)
+                        SELECT %s, COALESCE(MAX(version), 0) + 1, %s
+                        FROM configurations WHERE service = %s
+                        RETURNING version
+                        """,
+                        (service, Jsonb(payload), service),
+                        prepare=True
+                    )
+                    current_version = (await cur.fetchone())[0]
+                else:
                     # Insert new configuration
                     await cur.execute(
                         """
-                        INSERT INTO configurations (service, version, payload, created_at)
-                        VALUES (%s, %s, %s, %s)
+                        INSERT INTO configurations (service, version, payload)
+                        VALUES (%s, %s, %s)
                         """,
-                        (service, current_version, json.dumps(payload), datetime.now())
+                        (service, version, Jsonb(payload)),
+                        prepare=True
                     )
-                    
-                    return {
-                        "service": service,
-                        "version": current_version,
-                        "status": "saved"
-                    }
-        
-        return self._loop.run_until_complete(save())
+                    current_version = version
+                
+                return {
+                    "service": service,
+                    "version": current_version,
+                    "status": "saved"
+                }
     
     @defer.inlineCallbacks
     def get_configuration(self, service: str, version: Optional[int] = None) -> Optional[Dict[str, Any]]:
-        """Get configuration from database"""
+        """Get configuration from cache or database"""
+        key = (service, version)
+        cacheable = version is not None or self._cache_latest
+        cached = self._cache.get(key) if cacheable else None
+        if cached is not None:
+            self._cache.move_to_end(key)
+            defer.returnValue(cached)
+        
+        generation = self._generation.get(service, 0)
         try:
-            result = yield threads.deferToThread(
-                self._get_config_sync, service, version
-            )
+            result = yield self._run(self._get_config(service, version))
+            if cacheable and result is not None and self._generation.get(service, 0) == generation:
+                self._remember(key, result)
             defer.returnValue(result)
         except Exception as e:
             log.err(f"Failed to get configuration: {e}")
             raise
     
-    def _get_config_sync(self, service: str, version: Optional[int] = None) -> Optional[Dict[str, Any]]:
-        """Synchronous get configuration using the existing loop"""
-        async def get():
-            async with self.pool.acquire() as conn:
-                async with conn.cursor() as cur:
-                    if version is not None:
-                        # Get specific version
-                        await cur.execute(
-                            "SELECT payload FROM configurations WHERE service = %s AND version = %s",
-                            (service, version)
-                        )
-                    else:
-                        # Get latest version
-                        await cur.execute(
-                            """
-                            SELECT payload FROM configurations 
-                            WHERE service = %s 
-                            ORDER BY version DESC 
-                            LIMIT 1
-                            """,
-                            (service,)
-                        )
-                    
-                    row = await cur.fetchone()
-                    if row:
-                        return json.loads(row[0]) if isinstance(row[0], str) else row[0]
-                    return None
+    async def _get_config(self, service: str, version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Get configuration query"""
+        async with self.pool.connection() as conn:
+            async with conn.cursor(binary=True) as cur:
+                if version is not None:
+                    # Get specific version
+                    await cur.execute(
+                        "SELECT payload FROM configurations WHERE service = %s AND version = %s",
+                        (service, version),
+                        prepare=True
+                    )
+                else:
+                    # Get latest version
+                    await cur.execute(
+                        """
+                        SELECT payload FROM configurations 
+                        WHERE service = %s 
+                        ORDER BY version DESC 
+                        LIMIT 1
+                        """,
+                        (service,),
+                        prepare=True
+                    )
+                
+                # psycopg loads jsonb columns straight into Python objects
+                row = await cur.fetchone()
+                return row[0] if row else None
+    
+    @defer.inlineCallbacks
+    def get_configurations(self, service: str, versions: List[int]) -> Dict[int, Dict[str, Any]]:
+        """Get several configuration versions, keyed by version, in one query"""
+        found = {}
+        missing = []
+        for version in versions:
+            key = (service, version)
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                found[version] = cached
+            else:
+                missing.append(version)
         
-        return self._loop.run_until_complete(get())
+        if missing:
+            try:
+                rows = yield self._run(self._get_configs(service, missing))
+            except Exception as e:
+                log.err(f"Failed to get configurations: {e}")
+                raise
+            # Explicit versions are immutable, so no generation check is needed
+            for version, payload in rows:
+                self._remember((service, version), payload)
+                found[version] = payload
+        
+        defer.returnValue({v: found[v] for v in versions if v in found})
+    
+    async def _get_configs(self, service: str, versions: List[int]) -> List[Tuple[int, Dict[str, Any]]]:
+        """Get configuration versions query"""
+        async with self.pool.connection() as conn:
+            async with conn.cursor(binary=True) as cur:
+                await cur.execute(
+                    "SELECT version, payload FROM configurations WHERE service = %s AND version = ANY(%s)",
+                    (service, versions),
+                    prepare=True
+                )
+                return await cur.fetchall()
     
     @defer.inlineCallbacks
     def get_configuration_history(self, service: str) -> List[Dict[str, Any]]:
         """Get configuration history for a service"""
         try:
-            result = yield threads.deferToThread(
-                self._get_history_sync, service
-            )
+            result = yield self._run(self._get_history(service))
             defer.returnValue(result)
         except Exception as e:
             log.err(f"Failed to get configuration history: {e}")
             raise
     
-    def _get_history_sync(self, service: str) -> List[Dict[str, Any]]:
-        """Synchronous get configuration history using the existing loop"""
-        async def get_history():
-            async with self.pool.acquire() as conn:
-                async with conn.cursor() as cur:
-                    await cur.execute(
-                        """
-                        SELECT version, created_at FROM configurations 
-                        WHERE service = %s 
-                        ORDER BY version DESC
-                        """,
-                        (service,)
-                    )
-                    
-                    rows = await cur.fetchall()
-                    return [
-                        {
-                            "version": row[0],
-                            "created_at": row[1].isoformat()
-                        }
-                        for row in rows
-                    ]
-        
-        return self._loop.run_until_complete(get_history())
+    async def _get_history(self, service: str) -> List[Dict[str, Any]]:
+        """Get configuration history query"""
+        async with self.pool.connection() as conn:
+            async with conn.cursor(binary=True) as cur:
+                # Postgres renders the ISO 8601 timestamp, so rows ship as-is
+                await cur.execute(
+                    """
+                    SELECT version, to_char(created_at, 'YYYY-MM-DD"T"HH24:MI:SS.US')
+                    FROM configurations 
+                    WHERE service = %s 
+                    ORDER BY version DESC
+                    """,
+                    (service,),
+                    prepare=True
+                )
+                
+                rows = await cur.fetchall()
+                return [
+                    {"version": version, "created_at": created_at}
+                    for version, created_at in rows
+                ]
+    
+    def _remember(self, key: Tuple[str, Optional[int]], payload: Dict[str, Any]):
+        """Store a payload in the cache, evicting the least recently used entry"""
+        self._cache[key] = payload
+        self._cache.move_to_end(key)
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+    
+    def _invalidate(self, service: str):
+        """Drop cached entries that a new version of service makes stale"""
+        self._generation[service] = self._generation.get(service, 0) + 1
+        # Stored versions are immutable; only the "latest" entry changes
+        self._cache.pop((service, None), None)
+    
+    async def _close_pool(self, pool: AsyncConnectionPool):
+        """Close the psycopg pool and its connections"""
+        await pool.close()
     
-    def close(self):
+    def close(self) -> defer.Deferred:
         """Close database connections"""
-        if self.pool:
-            self._loop.run_until_complete(self.pool.close())
-        if self._loop and not self._loop.is_closed():
-            self._loop.close()
\ No newline at end of file
+        if not self.pool:
+            return defer.succeed(None)
+        pool, self.pool = self.pool, None
+        return self._run(self._close_pool(pool))
\ No newline at end of file
@@ -2,13 +2,93 @@
 Configuration models and validation
 """
 
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Union, IO, Iterable, Iterator, FrozenSet, Tuple, TYPE_CHECKING
 from dataclasses import dataclass
-import yaml
+from functools import lru_cache
+import hashlib
 import json
-from jinja2 import Template, Environment, BaseLoader
+import math
+import orjson
 
-@dataclass
+# yaml and jinja2 are imported on first use: read-only traffic never parses
+# YAML, and only ?template=1 requests need Jinja2
+if TYPE_CHECKING:
+    from jinja2 import Environment, Template
+
+# Marks a field absent from the configuration
+_MISSING = object()
+
+# Shared Jinja2 environment for rendering and inspecting stored configurations
+_ENV: Optional["Environment"] = None
+
+def _environment() -> "Environment":
+    """Return the shared Jinja2 environment, creating it on first use"""
+    global _ENV
+    if _ENV is None:
+        from jinja2 import Environment, BaseLoader
+        _ENV = Environment(loader=BaseLoader(), keep_trailing_newline=True)
+    return _ENV
+
+@lru_cache(maxsize=None)
+def _yaml_loader():
+    """Safe loader (libyaml-backed when available) that refuses NaN and infinity"""
+    import yaml
+    
+    base = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    
+    def construct_finite_float(loader, node):
+        # JSON can't hold these, and storage would silently turn them into null;
+        # checking here avoids a second walk over the parsed document
+        value = base.construct_yaml_float(loader, node)
+        if not math.isfinite(value):
+            raise yaml.constructor.ConstructorError(
+                None, None, "NaN and infinity are not supported", node.start_mark
+            )
+        return value
+    
+    loader = type('_FiniteSafeLoader', (base,), {})
+    loader.add_constructor('tag:yaml.org,2002:float', construct_finite_float)
+    return loader
+
+@lru_cache(maxsize=1024)
+def _compile(source: str) -> "Template":
+    """Compile template source once; every (service, version) renders the same source"""
+    return _environment().from_string(source)
+
+@lru_cache(maxsize=1024)
+def _undeclared(source: str) -> FrozenSet[str]:
+    """Names a template source expects from its render context"""
+    from jinja2 import meta
+    return frozenset(meta.find_undeclared_variables(_environment().parse(source)))
+
+def _template_strings(value: Any) -> Iterator[str]:
+    """Yield strings nested anywhere in value, keys included, that hold template syntax"""
+    # Explicit stack: no generator frame per nesting level, no recursion limit
+    stack = [value]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, str):
+            if '{{' in value or '{%' in value:
+                yield value
+        elif isinstance(value, dict):
+            stack.extend(value.keys())
+            stack.extend(value.values())
+        elif isinstance(value, list):
+            stack.extend(value)
+
+def _render(value: Any, template_vars: Dict[str, Any]) -> Any:
+    """Render template strings nested anywhere in value, keys included"""
+    if isinstance(value, str):
+        if '{{' in value or '{%' in value:
+            return _compile(value).render(**template_vars)
+        return value
+    if isinstance(value, dict):
+        return {_render(k, template_vars): _render(v, template_vars) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_render(item, template_vars) for item in value]
+    return value
+
+@dataclass(slots=True, frozen=True)
 class ConfigurationModel:
     """Configuration model"""
     service: str
@@ -19,96 +99,103 @@ class ConfigurationModel:
 class ConfigurationValidator:
     """Validates configuration data"""
     
-    REQUIRED_FIELDS = ['version']
-    REQUIRED_DATABASE_FIELDS = ['database.host', 'database.port']
-    
     @staticmethod
-    def validate_yaml(yaml_content: str) -> Dict[str, Any]:
-        """Validate and parse YAML content"""
+    def validate_yaml(yaml_content: Union[str, bytes, IO[bytes]]) -> Dict[str, Any]:
+        """Validate and parse YAML content (str, UTF-8 bytes or a binary stream)"""
+        import yaml
+        
         try:
-            data = yaml.safe_load(yaml_content)
+            data = yaml.load(yaml_content, Loader=_yaml_loader())
             if data is None:
                 raise ValueError("Empty YAML content")
             return data
         except yaml.YAMLError as e:
-            raise ValueError(f"Invalid YAML: {str(e)}")
+            # Parser details stay on __cause__ until someone formats them
+            raise ValueError("Invalid YAML") from e
     
     @staticmethod
-    def validate_configuration(data: Dict[str, Any]) -> List[str]:
-        """Validate configuration data and return list of errors"""
+    def validate_configuration(data: Dict[str, Any]) -> Tuple[str, ...]:
+        """Validate configuration data and return a tuple of errors"""
         errors = []
         
-        # Check required fields
-        for field in ConfigurationValidator.REQUIRED_FIELDS:
-            if field not in data:
-                errors.append(f"Missing required field: {field}")
+        # Look each field up once; _MISSING tells absent apart from None.
+        # A document that isn't a mapping (e.g. a YAML list) has no fields.
+        if not isinstance(data, dict):
+            data = {}
+        version = data.get('version', _MISSING)
+        database = data.get('database')
+        if not isinstance(database, dict):
+            database = {}
+        host = database.get('host', _MISSING)
+        port = database.get('port', _MISSING)
         
-        # Check nested database fields
-        for field in ConfigurationValidator.REQUIRED_DATABASE_FIELDS:
-            keys = field.split('.')
-            current = data
-            try:
-                for key in keys:
-                    if not isinstance(current, dict) or key not in current:
-                        errors.append(f"Missing required field: {field}")
-                        break
-                    current = current[key]
-            except (TypeError, KeyError):
-                errors.append(f"Missing required field: {field}")
+        # Check required fields
+        if version is _MISSING:
+            errors.append("Missing required field: version")
+        if host is _MISSING:
+            errors.append("Missing required field: database.host")
+        if port is _MISSING:
+            errors.append("Missing required field: database.port")
         
-        # Validate version is integer
-        if 'version' in data and not isinstance(data['version'], int):
+        # Validate field types
+        if version is not _MISSING and not isinstance(version, int):
             errors.append("Field 'version' must be an integer")
+        if port is not _MISSING and not isinstance(port, int):
+            errors.append("Field 'database.port' must be an integer")
         
-        # Validate database port is integer
-        if 'database' in data and 'port' in data['database']:
-            if not isinstance(data['database']['port'], int):
-                errors.append("Field 'database.port' must be an integer")
-        
-        return errors
+        return tuple(errors)
+    
+    @classmethod
+    def validate_many(cls, datas: Iterable[Dict[str, Any]]) -> List[Tuple[str, ...]]:
+        """Validate several configurations; returns one error tuple per item, in order"""
+        validate = cls.validate_configuration
+        return [validate(data) for data in datas]
 
 class ConfigurationProcessor:
     """Processes configurations with templating"""
     
     @staticmethod
     def process_template(config: Dict[str, Any], template_vars: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-        """Process configuration through Jinja2 template engine"""
+        """Process configuration through Jinja2 template engine; returns config itself when it has no templates"""
         if template_vars is None:
             template_vars = {}
         
-        # Convert config to JSON string for template processing
-        config_json = json.dumps(config, indent=2)
-        
-        # Create Jinja2 environment
-        env = Environment(loader=BaseLoader())
-        template = env.from_string(config_json)
+        # Most stored configurations hold no templates at all
+        if not ConfigurationProcessor.has_templates(config):
+            return config
         
-        # Render template
-        rendered_json = template.render(**template_vars)
+        from jinja2 import TemplateError
         
-        # Parse back to dictionary
+        # Only string leaves can hold template syntax; render those in place
         try:
-            return json.loads(rendered_json)
-        except json.JSONDecodeError as e:
-            raise ValueError(f"Template processing resulted in invalid JSON: {str(e)}")
+            return _render(config, template_vars)
+        except TemplateError as e:
+            raise ValueError(f"Template processing failed: {str(e)}")
+    
+    @staticmethod
+    def fingerprint(config: Dict[str, Any]) -> bytes:
+        """Stable 128-bit digest of configuration content, independent of key order"""
+        try:
+            canonical = orjson.dumps(config, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # Integers above 64 bits, which orjson can't encode
+            canonical = json.dumps(config, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode()
+        return hashlib.blake2b(canonical, digest_size=16).digest()
+    
+    @staticmethod
+    def has_templates(config: Dict[str, Any]) -> bool:
+        """Check whether any key or value in configuration holds template syntax"""
+        return next(_template_strings(config), None) is not None
     
     @staticmethod
     def extract_template_vars(config: Dict[str, Any]) -> List[str]:
         """Extract template variables from configuration"""
-        config_str = json.dumps(config)
-        env = Environment(loader=BaseLoader())
+        from jinja2 import TemplateError
         
-        try:
-            ast = env.parse(config_str)
-            variables = []
-            
-            def visit(node):
-                if hasattr(node, 'name') and isinstance(node.name, str):
-                    variables.append(node.name)
-                for child in node.iter_child_nodes():
-                    visit(child)
-            
-            visit(ast)
-            return list(set(variables))
-        except Exception:
-            return []
\ No newline at end of file
+        variables = set()
+        for source in _template_strings(config):
+            try:
+                variables |= _undeclared(source)
+            except TemplateError:
+                continue
+        return list(variables)
@@ -0,0 +1,159 @@
+"""
+Shared test doubles and fixtures
+"""
+
+import pytest
+import io
+from twisted.internet import defer
+from psycopg.errors import UniqueViolation
+
+from database.connection import DatabaseManager
+
+# Simple DummyRequest for testing
+class DummyRequest:
+    __slots__ = ('method', 'uri', 'args', 'content', 'headers', 'responseCode', 'written')
+    
+    def __init__(self, method=b'GET', uri=b'/config/test', args=None, content=b''):
+        self.method = method
+        self.uri = uri
+        self.args = args or {}
+        self.content = content
+        self.headers = {}
+        self.responseCode = 200
+        self.written = b''
+    
+    def setHeader(self, name, value):
+        self.headers[name] = value
+    
+    def setResponseCode(self, code):
+        self.responseCode = code
+    
+    def write(self, data):
+        self.written += data
+    
+    def finish(self):
+        pass
+
+# Minimal request for calling handlers directly
+class MockRequest:
+    __slots__ = ('args', 'content')
+    
+    def __init__(self, content=b'', args=None):
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        self.content = io.BytesIO(content)
+        self.args = args or {}
+
+# Mock database manager for testing
+class MockDatabaseManager:
+    __slots__ = ('configs', 'history')
+    
+    def __init__(self):
+        self.configs = {}
+        self.history = {}
+    
+    def save_configuration(self, service, payload, version=None):
+        if service not in self.configs:
+            self.configs[service] = {}
+            self.history[service] = []
+        
+        if version is None:
+            version = max(self.configs[service].keys(), default=0) + 1
+        
+        if version in self.configs[service]:
+            raise UniqueViolation("duplicate key value violates unique constraint")
+        
+        self.configs[service][version] = payload
+        self.history[service].append({
+            "version": version,
+            "created_at": "2025-08-19T12:00:00"
+        })
+        
+        return defer.succeed({
+            "service": service,
+            "version": version,
+            "status": "saved"
+        })
+    
+    def get_configuration(self, service, version=None):
+        if service not in self.configs or not self.configs[service]:
+            return defer.succeed(None)
+        
+        if version is not None:
+            config = self.configs[service].get(version)
+        else:
+            # Get latest version
+            latest_version = max(self.configs[service].keys())
+            config = self.configs[service][latest_version]
+        
+        return defer.succeed(config)
+    
+    def get_configurations(self, service, versions):
+        stored = self.configs.get(service, {})
+        return defer.succeed({v: stored[v] for v in versions if v in stored})
+    
+    def get_configuration_history(self, service):
+        if service not in self.history:
+            return defer.succeed([])
+        return defer.succeed(self.history[service])
+
+# DatabaseManager with the SQL layer replaced by a dict, for cache tests
+class StubDatabaseManager(DatabaseManager):
+    def __init__(self):
+        super().__init__("postgresql://unused")
+        self.rows = {}
+        self.queries = 0
+        self.batches = []
+    
+    def _run(self, coro):
+        # Stub coroutines never await, so drive them synchronously
+        try:
+            coro.send(None)
+        except StopIteration as e:
+            return defer.succeed(e.value)
+    
+    async def _save_config(self, service, payload, version=None):
+        if version is None:
+            version = max(self.rows.get(service, {}), default=0) + 1
+        self.rows.setdefault(service, {})[version] = payload
+        return {"service": service, "version": version, "status": "saved"}
+    
+    async def _get_config(self, service, version=None):
+        self.queries += 1
+        versions = self.rows.get(service)
+        if not versions:
+            return None
+        return versions.get(version if version is not None else max(versions))
+    
+    async def _get_configs(self, service, versions):
+        self.batches.append(list(versions))
+        stored = self.rows.get(service, {})
+        # Like the ANY(%s) query, rows come back in storage order
+        return [(v, stored[v]) for v in sorted(stored) if v in versions]
+
+@pytest.fixture
+def db_manager():
+    """Empty in-memory database manager"""
+    return MockDatabaseManager()
+
+@pytest.fixture
+def handler(db_manager):
+    """ConfigurationHandler backed by the db_manager fixture"""
+    from api.handlers import ConfigurationHandler
+    
+    return ConfigurationHandler(db_manager)
+
+@pytest.fixture
+def make_request():
+    """Factory for handler requests: make_request(content=b'', args=None)"""
+    return MockRequest
+
+@pytest.fixture
+def dummy_request():
+    """Factory for resource-level requests that record the response"""
+    return DummyRequest
+
+@pytest.fixture
+def stub_db_manager():
+    """Real DatabaseManager caching over an in-memory SQL layer"""
+    return StubDatabaseManager()
@@ -3,85 +3,10 @@ Tests for configuration management
 """
 
 import pytest
+import io
 import json
-from twisted.test import test_internet
-from twisted.web import server
 from twisted.internet import defer
 
-# Simple DummyRequest for testing
-class DummyRequest:
-    def __init__(self, method=b'GET', uri=b'/config/test', args=None, content=b''):
-        self.method = method
-        self.uri = uri
-        self.args = args or {}
-        self.content = content
-        self.headers = {}
-        self.responseCode = 200
-    
-    def setHeader(self, name, value):
-        self.headers[name] = value
-    
-    def setResponseCode(self, code):
-        self.responseCode = code
-    
-    def write(self, data):
-        if not hasattr(self, 'written'):
-            self.written = b''
-        self.written += data
-    
-    def finish(self):
-        pass
-
-# Mock database manager for testing
-class MockDatabaseManager:
-    def __init__(self):
-        self.configs = {}
-        self.history = {}
-    
-    @defer.inlineCallbacks
-    def save_configuration(self, service, payload, version=None):
-        if service not in self.configs:
-            self.configs[service] = {}
-            self.history[service] = []
-        
-        if version is None:
-            version = max(self.configs[service].keys(), default=0) + 1
-        
-        if version in self.configs[service]:
-            raise Exception("duplicate key value violates unique constraint")
-        
-        self.configs[service][version] = payload
-        self.history[service].append({
-            "version": version,
-            "created_at": "2025-08-19T12:00:00"
-        })
-        
-        defer.returnValue({
-            "service": service,
-            "version": version,
-            "status": "saved"
-        })
-    
-    @defer.inlineCallbacks
-    def get_configuration(self, service, version=None):
-        if service not in self.configs or not self.configs[service]:
-            defer.returnValue(None)
-        
-        if version is not None:
-            config = self.configs[service].get(version)
-        else:
-            # Get latest version
-            latest_version = max(self.configs[service].keys())
-            config = self.configs[service][latest_version]
-        
-        defer.returnValue(config)
-    
-    @defer.inlineCallbacks
-    def get_configuration_history(self, service):
-        if service not in self.history:
-            defer.returnValue([])
-        defer.returnValue(self.history[service])
-
 class TestConfigurationValidation:
     """Test configuration validation"""
     
@@ -116,6 +41,37 @@ class TestConfigurationValidation:
         with pytest.raises(ValueError, match="Invalid YAML"):
             ConfigurationValidator.validate_yaml(yaml_content)
     
+    def test_yaml_parsing_from_bytes(self):
+        from models.configuration import ConfigurationValidator
+        
+        yaml_content = 'version: 1\nwelcome_message: "Привет"\n'.encode('utf-8')
+        
+        result = ConfigurationValidator.validate_yaml(yaml_content)
+        assert result['version'] == 1
+        assert result['welcome_message'] == "Привет"
+        
+        with pytest.raises(ValueError, match="Invalid YAML"):
+            ConfigurationValidator.validate_yaml(b'version: \xff\n')
+    
+    def test_yaml_non_finite_floats_rejected(self):
+        from models.configuration import ConfigurationValidator
+        
+        # JSON can't represent NaN or infinity, wherever they appear
+        for yaml_content in (b'limits: [1.5, .nan]\n', b'ceiling: -.inf\n', b'.inf: key\n'):
+            with pytest.raises(ValueError, match="Invalid YAML") as excinfo:
+                ConfigurationValidator.validate_yaml(yaml_content)
+            assert "NaN and infinity are not supported" in str(excinfo.value.__cause__)
+        
+        assert ConfigurationValidator.validate_yaml(b'ratio: 1.5e+3\n') == {"ratio": 1500.0}
+    
+    def test_yaml_parsing_from_stream(self):
+        from models.configuration import ConfigurationValidator
+        
+        stream = io.BytesIO('version: 2\nwelcome_message: "Привет"\n'.encode('utf-8'))
+        
+        result = ConfigurationValidator.validate_yaml(stream)
+        assert result == {"version": 2, "welcome_message": "Привет"}
+    
     def test_configuration_validation(self):
         from models.configuration import ConfigurationValidator
         
@@ -142,6 +98,36 @@ class TestConfigurationValidation:
         assert len(errors) == 2  # Missing version and database.port
         assert "Missing required field: version" in errors
         assert "Missing required field: database.port" in errors
+        
+        # Wrong types, and a database section that isn't a mapping
+        errors = ConfigurationValidator.validate_configuration({"version": "1", "database": "db.local"})
+        assert errors == (
+            "Missing required field: database.host",
+            "Missing required field: database.port",
+            "Field 'version' must be an integer"
+        )
+        
+        errors = ConfigurationValidator.validate_configuration({
+            "version": 1,
+            "database": {"host": "db.local", "port": "5432"}
+        })
+        assert errors == ("Field 'database.port' must be an integer",)
+        
+        # A YAML document that isn't a mapping has none of the fields
+        errors = ConfigurationValidator.validate_configuration(["version", 1])
+        assert len(errors) == 3
+    
+    def test_validate_many(self):
+        from models.configuration import ConfigurationValidator
+        
+        valid = {"version": 1, "database": {"host": "db.local", "port": 5432}}
+        
+        results = ConfigurationValidator.validate_many([valid, {"version": 2}, valid])
+        assert results[0] == results[2] == ()
+        assert results[1] == (
+            "Missing required field: database.host",
+            "Missing required field: database.port"
+        )
 
 class TestConfigurationProcessor:
     """Test configuration template processing"""
@@ -176,30 +162,87 @@ class TestConfigurationProcessor:
         
         result = ConfigurationProcessor.process_template(config, {})
         assert result['message'] == "Hello World!"
+    
+    def test_template_processing_without_markers(self):
+        from models.configuration import ConfigurationProcessor
+        
+        config = {"version": 1, "hosts": ["a.local", "b.local"], "database": {"port": 5432}}
+        
+        assert not ConfigurationProcessor.has_templates(config)
+        assert ConfigurationProcessor.process_template(config, {"user": "Alice"}) is config
+    
+    def test_template_processing_nested_values(self):
+        from models.configuration import ConfigurationProcessor
+        
+        config = {
+            "version": 1,
+            "hosts": ["{{ region }}-a.local", "static.local"],
+            "quoted": '"{{ user }}"',
+            "limits": {"{{ region }}": 10, "enabled": True},
+            "script": "echo {{ user }}\n"
+        }
+        
+        result = ConfigurationProcessor.process_template(config, {"region": "eu", "user": "Al"})
+        assert result == {
+            "version": 1,
+            "hosts": ["eu-a.local", "static.local"],
+            "quoted": '"Al"',
+            "limits": {"eu": 10, "enabled": True},
+            "script": "echo Al\n"
+        }
+        
+        with pytest.raises(ValueError, match="Template processing failed"):
+            ConfigurationProcessor.process_template({"message": "{{ user "}, {})
+    
+    def test_fingerprint(self):
+        from models.configuration import ConfigurationProcessor
+        
+        first = {"version": 1, "database": {"host": "db.local", "port": 5432}}
+        reordered = {"database": {"port": 5432, "host": "db.local"}, "version": 1}
+        
+        assert ConfigurationProcessor.fingerprint(first) == ConfigurationProcessor.fingerprint(reordered)
+        assert len(ConfigurationProcessor.fingerprint(first)) == 16
+        assert ConfigurationProcessor.fingerprint(first) != ConfigurationProcessor.fingerprint({"version": 2})
+        
+        # Integers above 64 bits are stored exactly, so they must fingerprint too
+        big = ConfigurationProcessor.fingerprint({"version": 1, "max_bytes": 2 ** 64})
+        assert big == ConfigurationProcessor.fingerprint({"max_bytes": 2 ** 64, "version": 1})
+        assert big != ConfigurationProcessor.fingerprint({"version": 1, "max_bytes": 2 ** 64 + 1})
+    
+    def test_extract_template_vars(self):
+        from models.configuration import ConfigurationProcessor
+        
+        config = {
+            "version": 1,
+            "message": "Hello {{ user | default('World') }}!",
+            "hosts": ["{% for h in hosts %}{{ h }}{% endfor %}", "static.local"],
+            "{{ region }}": {"broken": "{{ oops"}
+        }
+        
+        variables = ConfigurationProcessor.extract_template_vars(config)
+        assert sorted(variables) == ["hosts", "region", "user"]
+    
+    def test_compiled_template_reused(self):
+        from models.configuration import ConfigurationProcessor, _compile
+        
+        config = {
+            "version": 3,
+            "message": "Hello {{ user }} from compiled cache!"
+        }
+        
+        ConfigurationProcessor.process_template(config, {"user": "Alice"})
+        hits = _compile.cache_info().hits
+        result = ConfigurationProcessor.process_template(config, {"user": "Bob"})
+        
+        assert result['message'] == "Hello Bob from compiled cache!"
+        assert _compile.cache_info().hits == hits + 1
 
 class TestAPIHandlers:
     """Test API request handlers"""
     
     @pytest.mark.twisted
     @defer.inlineCallbacks
-    def test_post_configuration(self):
-        from api.handlers import ConfigurationHandler
-        
-        db_manager = MockDatabaseManager()
-        handler = ConfigurationHandler(db_manager)
-        
-        # Create mock request
-        class MockRequest:
-            def __init__(self, content):
-                self.content = MockContent(content)
-        
-        class MockContent:
-            def __init__(self, content):
-                self._content = content.encode('utf-8')
-            
-            def read(self):
-                return self._content
-        
+    def test_post_configuration(self, handler, make_request):
         yaml_content = """
         version: 1
         database:
@@ -207,7 +250,7 @@ class TestAPIHandlers:
           port: 5432
         """
         
-        request = MockRequest(yaml_content)
+        request = make_request(yaml_content)
         result = yield handler.handle_post_config(request, "test_service")
         
         assert result['service'] == "test_service"
@@ -216,24 +259,59 @@ class TestAPIHandlers:
     
     @pytest.mark.twisted
     @defer.inlineCallbacks
-    def test_get_configuration(self):
-        from api.handlers import ConfigurationHandler
+    def test_post_duplicate_version(self, handler, make_request):
+        yaml_content = b"version: 1\ndatabase:\n  host: test.local\n  port: 5432\n"
+        
+        yield handler.handle_post_config(make_request(yaml_content), "test_service")
+        result = yield handler.handle_post_config(make_request(yaml_content), "test_service")
+        
+        assert result['status_code'] == 409
+    
+    @pytest.mark.twisted
+    @defer.inlineCallbacks
+    def test_post_non_mapping_configuration(self, handler, make_request):
+        result = yield handler.handle_post_config(make_request(b"- version\n- 1\n"), "test_service")
         
-        db_manager = MockDatabaseManager()
-        handler = ConfigurationHandler(db_manager)
+        assert result['status_code'] == 422
+    
+    @pytest.mark.twisted
+    @defer.inlineCallbacks
+    def test_post_invalid_yaml(self, handler, make_request):
+        result = yield handler.handle_post_config(make_request(b"version: [\n"), "test_service")
         
+        assert result['status_code'] == 400
+        assert result['message'].startswith("Invalid YAML: ")
+        assert "line 2" in result['message']
+    
+    @pytest.mark.twisted
+    @defer.inlineCallbacks
+    def test_post_large_configuration(self, handler, db_manager, make_request):
+        # Large enough to be parsed from the stream rather than read whole
+        features = "".join(f"  flag_{i}: true\n" for i in range(10000))
+        yaml_content = (
+            "version: 1\n"
+            "database:\n"
+            "  host: \"test.local\"\n"
+            "  port: 5432\n"
+            "features:\n" + features
+        )
+        
+        request = make_request(yaml_content)
+        result = yield handler.handle_post_config(request, "test_service")
+        
+        assert result['version'] == 1
+        assert len(db_manager.configs["test_service"][1]['features']) == 10000
+    
+    @pytest.mark.twisted
+    @defer.inlineCallbacks
+    def test_get_configuration(self, handler, db_manager, make_request):
         # First save a configuration
         yield db_manager.save_configuration("test_service", {
             "version": 1,
             "database": {"host": "test.local", "port": 5432}
         })
         
-        # Create mock request
-        class MockRequest:
-            def __init__(self):
-                self.args = {}
-        
-        request = MockRequest()
+        request = make_request()
         result = yield handler.handle_get_config(request, "test_service")
         
         assert result['version'] == 1
@@ -241,18 +319,186 @@ class TestAPIHandlers:
     
     @pytest.mark.twisted
     @defer.inlineCallbacks
-    def test_get_configuration_not_found(self):
-        from api.handlers import ConfigurationHandler
+    def test_get_configuration_not_found(self, handler, make_request):
+        request = make_request()
+        result = yield handler.handle_get_config(request, "nonexistent_service")
         
-        db_manager = MockDatabaseManager()
-        handler = ConfigurationHandler(db_manager)
+        assert result['error'] == "Not Found"
+        assert result['status_code'] == 404
+    
+    @pytest.mark.twisted
+    @defer.inlineCallbacks
+    def test_get_configuration_versions(self, handler, db_manager, make_request):
+        for version in (1, 2, 3):
+            yield db_manager.save_configuration("test_service", {
+                "version": version,
+                "welcome_message": "Hello {{ user }}!"
+            })
+        
+        request = make_request(args={b'versions': [b'3,1,42'], b'template': [b'1'], b'user': [b'Alice']})
+        result = yield handler.handle_get_config(request, "test_service")
         
-        class MockRequest:
-            def __init__(self):
-                self.args = {}
+        assert list(result) == ["3", "1"]
+        assert result["1"]["version"] == 1
+        assert result["3"]["welcome_message"] == "Hello Alice!"
         
-        request = MockRequest()
-        result = yield handler.handle_get_config(request, "nonexistent_service")
+        request = make_request(args={b'versions': [b'1,two']})
+        result = yield handler.handle_get_config(request, "test_service")
+        assert result['status_code'] == 400
         
-        assert result['error'] == "Not Found"
-        assert result['status_code'] == 404
\ No newline at end of file
+        request = make_request(args={b'versions': [b'41,42']})
+        result = yield handler.handle_get_config(request, "test_service")
+        assert result['status_code'] == 404
+    
+    @pytest.mark.twisted
+    @defer.inlineCallbacks
+    def test_get_configuration_template_vars_decoding(self, handler, db_manager, make_request):
+        yield db_manager.save_configuration("test_service", {
+            "version": 1,
+            "welcome_message": "Hello {{ user }}!"
+        })
+        
+        request = make_request(args={b'template': [b'1'], b'user': ['Zoë'.encode('utf-8')]})
+        result = yield handler.handle_get_config(request, "test_service")
+        assert result['welcome_message'] == "Hello Zoë!"
+        
+        request = make_request(args={b'template': [b'1'], b'user': [b'\xff']})
+        result = yield handler.handle_get_config(request, "test_service")
+        assert result['status_code'] == 400
+
+class TestConfigResource:
+    """Test config resource routing"""
+    
+    def test_service_resources_reused(self, db_manager, dummy_request):
+        from api.server import ConfigResource
+        
+        config_resource = ConfigResource(db_manager)
+        config_resource.MAX_CACHED_SERVICES = 2
+        
+        first = config_resource.getChild(b'svc_a', dummy_request())
+        assert config_resource.getChild(b'svc_a', dummy_request()) is first
+        assert first.service_name == 'svc_a'
+        
+        config_resource.getChild(b'svc_b', dummy_request())
+        config_resource.getChild(b'svc_c', dummy_request())
+        assert config_resource.getChild(b'svc_a', dummy_request()) is not first
+
+class TestServerResponses:
+    """Test response serialization"""
+    
+    def test_failure_response(self, dummy_request):
+        from twisted.python.failure import Failure
+        from api.server import _write_failure
+        
+        request = dummy_request()
+        _write_failure(Failure(RuntimeError('boom "quoted"')), request)
+        
+        assert request.responseCode == 500
+        assert json.loads(request.written) == {
+            "error": "Internal server error",
+            "message": "RuntimeError"
+        }
+        assert request.headers[b'content-length'] == b'%d' % len(request.written)
+    
+    def test_failure_response_debug(self, monkeypatch, dummy_request):
+        from twisted.python.failure import Failure
+        from api import server as api_server
+        
+        monkeypatch.setattr(api_server, 'DEBUG', True)
+        request = dummy_request()
+        api_server._write_failure(Failure(RuntimeError('boom "quoted"')), request)
+        
+        assert json.loads(request.written)["message"] == 'boom "quoted"'
+
+class TestJsonPayloads:
+    """Test payload serialization beyond orjson's 64-bit integer range"""
+    
+    def test_big_integer_round_trip(self):
+        from database.connection import _dump_json, _load_json
+        
+        payload = {"version": 1, "max_bytes": 2 ** 64, "min_offset": -2 ** 63 - 1, 7: "seven"}
+        
+        stored = _dump_json(payload)
+        assert _load_json(stored) == {"version": 1, "max_bytes": 2 ** 64, "min_offset": -2 ** 63 - 1, "7": "seven"}
+        assert type(_load_json(stored)["max_bytes"]) is int
+        assert _load_json(_dump_json({"port": 5432})) == {"port": 5432}
+    
+    def test_big_integer_response(self, dummy_request):
+        from api.server import _write_json
+        
+        request = dummy_request()
+        _write_json(request, {"max_bytes": 2 ** 64, "name": "é"})
+        
+        assert request.written == '{"max_bytes":18446744073709551616,"name":"é"}'.encode('utf-8')
+        assert request.headers[b'content-length'] == b'%d' % len(request.written)
+    
+    def test_pretty_response(self, dummy_request):
+        from api.server import _write_json
+        
+        expected = '{\n  "database": {\n    "port": 5432\n  },\n  "name": "é"\n}'.encode('utf-8')
+        
+        request = dummy_request(args={b'pretty': [b'1']})
+        _write_json(request, {"database": {"port": 5432}, "name": "é"})
+        assert request.written == expected
+        assert request.headers[b'content-length'] == b'%d' % len(request.written)
+        
+        # The fallback for integers above 64 bits indents the same way
+        request = dummy_request(args={b'pretty': [b'1']})
+        _write_json(request, {"database": {"port": 2 ** 64}, "name": "é"})
+        assert request.written == expected.replace(b'5432', b'18446744073709551616')
+        assert request.headers[b'content-length'] == b'%d' % len(request.written)
+
+class TestDatabaseCache:
+    """Test DatabaseManager configuration caching"""
+    
+    @pytest.mark.twisted
+    @defer.inlineCallbacks
+    def test_latest_configuration_cached_until_save(self, stub_db_manager):
+        yield stub_db_manager.save_configuration("svc", {"version": 1})
+        
+        first = yield stub_db_manager.get_configuration("svc")
+        second = yield stub_db_manager.get_configuration("svc")
+        assert first == second == {"version": 1}
+        assert stub_db_manager.queries == 1
+        
+        yield stub_db_manager.save_configuration("svc", {"version": 2})
+        latest = yield stub_db_manager.get_configuration("svc")
+        assert latest == {"version": 2}
+        assert stub_db_manager.queries == 2
+        
+        # Stored versions never change, so they stay cached across saves
+        yield stub_db_manager.get_configuration("svc", 1)
+        yield stub_db_manager.save_configuration("svc", {"version": 3})
+        old = yield stub_db_manager.get_configuration("svc", 1)
+        assert old == {"version": 1}
+        assert stub_db_manager.queries == 3
+    
+    @pytest.mark.twisted
+    @defer.inlineCallbacks
+    def test_missing_configuration_not_cached(self, stub_db_manager):
+        result = yield stub_db_manager.get_configuration("svc")
+        assert result is None
+        
+        yield stub_db_manager.save_configuration("svc", {"version": 1})
+        result = yield stub_db_manager.get_configuration("svc")
+        assert result == {"version": 1}
+    
+    @pytest.mark.twisted
+    @defer.inlineCallbacks
+    def test_batch_fetches_only_uncached_versions(self, stub_db_manager):
+        for version in (1, 2, 3):
+            yield stub_db_manager.save_configuration("svc", {"version": version}, version)
+        
+        first = yield stub_db_manager.get_configurations("svc", [3, 1])
+        assert list(first) == [3, 1]
+        assert stub_db_manager.batches == [[3, 1]]
+        
+        # Cached versions are served locally; unknown ones are simply absent
+        second = yield stub_db_manager.get_configurations("svc", [2, 3, 42, 1])
+        assert list(second) == [2, 3, 1]
+        assert second[2] == {"version": 2}
+        assert stub_db_manager.batches == [[3, 1], [2, 42]]
+        
+        # Batch results also fill the single-version cache
+        yield stub_db_manager.get_configuration("svc", 2)
+        assert stub_db_manager.queries == 0